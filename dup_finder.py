@@ -1,78 +1,333 @@
 import os
+import re
+import errno
 import sys
+import gzip
 import json
+import mmap
+import pickle
 import shutil
 import hashlib
-import tempfile
+import sqlite3
+import logging
+import operator
 import argparse
+from dataclasses import dataclass, asdict
+import threading
 import subprocess
 import datetime
-from filelock import FileLock
+import itertools
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from logger import configure_logger
 
+try:
+    from blake3 import blake3
+except ImportError:  # blake3 未安装时回退到标准库 sha256
+    blake3 = None
+
+try:
+    import orjson
+except ImportError:  # orjson 未安装时回退到标准库 json
+    orjson = None
+
+try:
+    import ahocorasick
+except ImportError:  # pyahocorasick 未安装时回退到合并正则的单遍匹配
+    ahocorasick = None
+
 
 logger = configure_logger("DupFinder")
 
+# 去重只需要低碰撞概率，不需要抗攻击的加密强度；blake3 比 sha256 快 5-10 倍
+HASH_ALGO_NAME = 'blake3' if blake3 else 'sha256'
+logger.debug("Using %s for file identifiers", HASH_ALGO_NAME)
+
+
+@dataclass(slots=True)
+class FileInfo:
+    """候选文件的元数据；slots 版本比同样内容的字典省数倍内存。"""
+    path: str
+    size: int
+    type: str
+    modified_time: float
+    priority: int = 0
+
+
+# 大文件流式读取的缓冲大小，摊薄每次 read 的系统调用开销
+_READ_BUFFER_SIZE = 4 << 20
+# 不超过该大小的文件用 mmap 一次性喂给哈希函数
+_MMAP_THRESHOLD = 256 << 20
+
 
-def get_file_hash(file_path, hash_algo=hashlib.sha256):
+def get_file_hash(file_path, size=None):
     """Calculate the hash of a file."""
-    hash_obj = hash_algo()
-    with open(file_path, 'rb') as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash_obj.update(chunk)
-    return hash_obj.hexdigest()
+    with open(file_path, 'rb', buffering=0) as f:
+        fd = f.fileno()
+        if hasattr(os, 'posix_fadvise'):
+            # 提示内核顺序读取，提前做预读
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        if size is None:
+            size = os.fstat(fd).st_size
+        if 0 < size <= _MMAP_THRESHOLD:
+            if blake3 is not None:
+                # blake3 自带的 mmap 路径：一次 C 调用映射整个文件，
+                # 内部按 Merkle 子树多线程并行
+                return blake3(max_threads=blake3.AUTO).update_mmap(file_path).hexdigest()
+            # 整个文件一次 update，免去 Python 层的分块循环
+            hash_obj = _new_sha256()
+            with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mm:
+                if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                    # 顺序访问提示：内核激进预读，用过的页尽早回收
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                hash_obj.update(memoryview(mm))
+            return hash_obj.hexdigest()
+        if blake3 is None:
+            if hasattr(hashlib, 'file_digest'):
+                # file_digest 在 C 层完成读取循环，并使用 OpenSSL 的 SHA-NI 加速路径
+                return hashlib.file_digest(f, 'sha256').hexdigest()
+            # 旧版本 Python：预分配缓冲 + readinto，每块不再分配新的 bytes 对象
+            hash_obj = _new_sha256()
+            buf = bytearray(_READ_BUFFER_SIZE)
+            view = memoryview(buf)
+            while n := f.readinto(buf):
+                hash_obj.update(view[:n])
+            return hash_obj.hexdigest()
+        # 超过 mmap 阈值的大文件让 blake3 用内部线程并行处理各个子树；
+        # 双缓冲读取，让下一块的磁盘读与当前块的哈希计算重叠
+        hash_obj = blake3(max_threads=blake3.AUTO)
+        with ThreadPoolExecutor(max_workers=1) as reader:
+            pending = reader.submit(f.read, _READ_BUFFER_SIZE)
+            while True:
+                chunk = pending.result()
+                if not chunk:
+                    break
+                pending = reader.submit(f.read, _READ_BUFFER_SIZE)
+                hash_obj.update(chunk)
+        return hash_obj.hexdigest()
+
+# 不超过一个文件系统块的文件整块读入，一次性哈希
+_TINY_FILE_THRESHOLD = 4096
+
+# 全量哈希前向内核预告的文件数，让下几个文件的磁盘读与当前哈希重叠
+_PREFETCH_LOOKAHEAD = 4
+
+
+def _advise_willneed(file_path):
+    """提示内核预读整个文件；纯建议性操作，失败可以忽略。"""
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        fd = os.open(file_path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+    finally:
+        os.close(fd)
+
+# 每次 hashlib.sha256() 都要新建一个 OpenSSL EVP_MD_CTX；
+# 复用线程本地的空上下文，copy 一份比从头初始化便宜
+_thread_state = threading.local()
+
+
+def _new_sha256():
+    proto = getattr(_thread_state, 'sha256_proto', None)
+    if proto is None:
+        proto = _thread_state.sha256_proto = hashlib.sha256()
+    return proto.copy()
+
 
-def generate_file_identifier(file_path):
+# 空文件内容必然一致，不用打开就知道标识
+_EMPTY_FILE_ID = (blake3(b'') if blake3 else hashlib.sha256(b'')).hexdigest()
+
+
+def generate_file_identifier(file_path, size=None):
     """Generate a unique identifier for a file."""
-    file_hash = get_file_hash(file_path, hashlib.sha256)
+    if size == 0:
+        return _EMPTY_FILE_ID
+    if size is not None and 0 < size <= _TINY_FILE_THRESHOLD:
+        # 跳过 fadvise/mmap 等流式开销；一次性哈希的结果与流式结果相同
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        if blake3:
+            return blake3(data).hexdigest()
+        hash_obj = _new_sha256()
+        hash_obj.update(data)
+        return hash_obj.hexdigest()
+    file_hash = get_file_hash(file_path, size)
     return file_hash
 
-def write_cache_to_file(cache, cache_file):
-    """Write the cache to the cache file atomically."""
-    with tempfile.NamedTemporaryFile('w', delete=False) as temp_file:
-        json.dump(cache, temp_file)
-        temp_file_path = temp_file.name
-    shutil.move(temp_file_path, cache_file)
-
-def load_cache(cache_file):
-    """Load the cache from the cache file."""
-    if not os.path.exists(cache_file):
-        return {}
+def quick_fingerprint(file_path, size):
+    """读取文件首尾各 64 KiB 生成廉价的二级指纹，用于全量哈希前再过滤一轮。"""
+    try:
+        with open(file_path, 'rb') as f:
+            head = f.read(65536)
+            if size > 131072:
+                f.seek(-65536, os.SEEK_END)
+                tail = f.read()
+            else:
+                tail = b''
+    except OSError as e:
+        logger.warning("Error fingerprinting file: %s - %s", file_path, e)
+        return None
+    return hashlib.blake2b(head + tail + size.to_bytes(8, 'little'), digest_size=16).digest()
+
+# 哈希缓存按 (dev, ino) 定位文件，重命名或移动不会使缓存失效
+_cache_lock = threading.Lock()
+
+
+def open_hash_cache(cache_file):
+    """打开（必要时创建）持久化的哈希缓存数据库。"""
+    # WAL 模式下多个进程可以并发读写，写事务之间由 SQLite 自行排队，
+    # 不再需要进程级的文件锁把整个扫描+哈希阶段串行化
+    cache = sqlite3.connect(cache_file, check_same_thread=False, timeout=30)
+    cache.execute('PRAGMA journal_mode=WAL')
+    cache.execute('PRAGMA synchronous=NORMAL')
+    cache.execute('PRAGMA busy_timeout = 30000')
+    cache.execute(
+        'CREATE TABLE IF NOT EXISTS hash_cache ('
+        'dev INTEGER, ino INTEGER, mtime INTEGER, size INTEGER, '
+        'digest TEXT, fingerprint BLOB, PRIMARY KEY (dev, ino))'
+    )
     try:
-        with open(cache_file, 'r') as f:
-            return json.load(f)
-    except json.decoder.JSONDecodeError:
-        os.remove(cache_file)
-        return {}
-
-def update_cache(cache, file_path, file_id):
-    """Update the cache with the file information."""
-    cache[file_path] = {
-        'file_id': file_id,
-        'modified_time': os.path.getmtime(file_path),
-        'size': os.path.getsize(file_path)
-    }
-
-def get_file_id(file_path, cache):
+        # 兼容没有 fingerprint 列的旧缓存
+        cache.execute('ALTER TABLE hash_cache ADD COLUMN fingerprint BLOB')
+    except sqlite3.OperationalError:
+        pass
+    return cache
+
+def get_file_id(file_path, cache, st=None):
     """Process a single file and return its file ID."""
-    # 检查文件路径是否指向一个普通文件
-    if not os.path.isfile(file_path):
-        logger.debug(f"Ignoring non-regular file: {file_path}")
+    if st is None:
+        try:
+            st = os.stat(file_path)
+        except OSError as e:
+            logger.warning("Error accessing file: %s - %s", file_path, e)
+            return None
+
+    with _cache_lock:
+        row = cache.execute(
+            'SELECT mtime, size, digest FROM hash_cache WHERE dev = ? AND ino = ?',
+            (st.st_dev, st.st_ino)
+        ).fetchone()
+    if row and row[0] == st.st_mtime_ns and row[1] == st.st_size and row[2] is not None:
+        return row[2]
+
+    try:
+        file_id = generate_file_identifier(file_path, st.st_size)
+    except OSError as e:
+        # 指纹和全量哈希之间文件可能被删除或改名，跳过即可，不能中断整个扫描
+        logger.warning("Error accessing file: %s - %s", file_path, e)
         return None
+    with _cache_lock:
+        # upsert 保留同一行里已缓存的 fingerprint
+        cache.execute(
+            'INSERT INTO hash_cache (dev, ino, mtime, size, digest) VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT (dev, ino) DO UPDATE SET '
+            'mtime = excluded.mtime, size = excluded.size, digest = excluded.digest',
+            (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size, file_id)
+        )
+    return file_id
+
+def get_quick_fingerprint(file_path, cache, st):
+    """带缓存的二级指纹：重扫描命中缓存时跳过首尾读取。"""
+    with _cache_lock:
+        row = cache.execute(
+            'SELECT mtime, size, fingerprint FROM hash_cache WHERE dev = ? AND ino = ?',
+            (st.st_dev, st.st_ino)
+        ).fetchone()
+    if row and row[0] == st.st_mtime_ns and row[1] == st.st_size and row[2] is not None:
+        return row[2]
+
+    fingerprint = quick_fingerprint(file_path, st.st_size)
+    if fingerprint is not None:
+        with _cache_lock:
+            # 文件已变化时同行的 digest 不再可信，一并清掉
+            cache.execute(
+                'INSERT INTO hash_cache (dev, ino, mtime, size, fingerprint) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT (dev, ino) DO UPDATE SET '
+                'mtime = excluded.mtime, size = excluded.size, '
+                'fingerprint = excluded.fingerprint, digest = NULL',
+                (st.st_dev, st.st_ino, st.st_mtime_ns, st.st_size, fingerprint)
+            )
+    return fingerprint
+
+def _scan_tree(directory):
+    """遍历目录树，生成普通文件的 DirEntry（不跟随目录符号链接）。"""
+    # 用显式栈代替递归，目录再深也不会触碰 Python 的递归上限
+    pending = [directory]
+    while pending:
+        current = pending.pop()
+        try:
+            it = os.scandir(current)
+        except OSError as e:
+            logger.warning("Error scanning directory: %s - %s", current, e)
+            continue
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    elif entry.is_file():
+                        yield entry
+                    else:
+                        logger.debug("Ignoring non-regular file: %s", entry.path)
+                except OSError as e:
+                    logger.warning("Error accessing file: %s - %s", entry.path, e)
+
+def _collect_sizes(directory, exclude_matcher, min_size=1):
+    """遍历单个目录树，返回按文件大小分组的元数据字典。"""
+    logger.info("Processing directory: %s", directory)
+    size_dict = {}
+    # 每个文件两三条 debug 日志，百万文件时连参数打包都省掉
+    debug_enabled = logger.isEnabledFor(logging.DEBUG)
+    for entry in _scan_tree(directory):
+        file_path = entry.path
+        if debug_enabled:
+            logger.debug("Processing file: %s", file_path)
+        # 检查文件路径是否包含排除关键字
+        if exclude_matcher and exclude_matcher(file_path):
+            if debug_enabled:
+                logger.debug("Excluding file: %s", file_path)
+            continue
+        try:
+            # DirEntry.stat() 复用目录枚举时缓存的属性，不再逐项 stat
+            st = entry.stat()
+        except OSError as e:
+            logger.warning("Error accessing file: %s - %s", file_path, e)
+            continue  # 忽略该文件继续循环
+        if st.st_size < min_size:
+            # 小文件重复通常不值得处理，哈希开销却固定；默认只跳过空文件
+            if debug_enabled:
+                logger.debug("Skipping file below min size: %s", file_path)
+            continue
+        stem, dot, ext = entry.name.rpartition('.')
+        file_type = dot + ext if stem else ''
+        # 保留整个 stat 结果，后续阶段不再对同一文件重复 stat
+        meta = (file_path, st, file_type)
+        if st.st_size in size_dict:
+            size_dict[st.st_size].append(meta)
+        else:
+            size_dict[st.st_size] = [meta]
+    return size_dict
 
-    file_info = cache.get(file_path)
-    if file_info:
-        cached_modified_time = file_info.get('modified_time')
-        cached_size = file_info.get('size')
-        current_modified_time = os.path.getmtime(file_path)
-        current_size = os.path.getsize(file_path)
+def build_keyword_matcher(keywords):
+    """把关键字列表编译成单遍扫描的匹配器，路径只扫一次而不是每个关键字扫一次。"""
+    if not keywords:
+        return None
+    if ahocorasick:
+        automaton = ahocorasick.Automaton()
+        for keyword in keywords:
+            automaton.add_word(keyword, keyword)
+        automaton.make_automaton()
 
-        if cached_modified_time == current_modified_time and cached_size == current_size:
-            return file_info['file_id']
+        def matcher(path):
+            return next(automaton.iter(path), None) is not None
 
-    file_id = generate_file_identifier(file_path)
-    update_cache(cache, file_path, file_id)
-    return file_id
+        return matcher
+    pattern = re.compile('|'.join(re.escape(keyword) for keyword in keywords))
+    return lambda path: pattern.search(path) is not None
 
 def parse_exclude_file(exclude_file):
     """Parse the exclude file and return a list of keywords."""
@@ -80,116 +335,217 @@ def parse_exclude_file(exclude_file):
         with open(exclude_file, 'r') as file:
             return [line.strip() for line in file if line.strip()]
     except Exception as e:
-        logger.error(f"Error reading exclude file {exclude_file}: {e}")
+        logger.error("Error reading exclude file %s: %s", exclude_file, e)
         return []
 
-def find_duplicates(directories, cache_file='file_cache.json', batch_size=10, exclude_keywords=None):
+def find_duplicates(directories, cache_file=None, batch_size=1000, exclude_keywords=None, hash_workers=None, min_size=1):
     """Find duplicate files in the given directories."""
-    lock_file = f"{cache_file}.lock"
-    lock = FileLock(lock_file)
-
-    with lock:
-        cache = load_cache(cache_file)
-        file_dict = {}
-        cache_updates = []
-
-        directories = list(set(directories))
-        for directory in directories:
-            logger.info("Processing directory: %s", directory)
-            for root, _, files in os.walk(directory):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    logger.debug("Processing file: %s", file_path)
-                    # 检查文件路径是否包含排除关键字
-                    if exclude_keywords and any(keyword in file_path for keyword in exclude_keywords):
-                        logger.debug(f"Excluding file: {file_path}")
-                        continue
-                    file_id = get_file_id(file_path, cache)
-                    if not file_id:
-                        logger.error(f"Error generating file ID for {file_path}")
-                        continue
-                    try:
-                        file_info = {
-                            'path': file_path,
-                            'size': os.path.getsize(file_path),  # File size in bytes
-                            'type': os.path.splitext(file_path)[1],
-                            'modified_time': os.path.getmtime(file_path)
-                        }
-                    except OSError as e:
-                        logger.warning(f"Error accessing file: {file_path} - {e}")
-                        continue  # 忽略该文件继续循环
-                    logger.debug("Process File ID: %s, File Info: %s", file_id, file_info)
-
-                    if file_id in file_dict:
-                        file_dict[file_id].append(file_info)
-                    else:
-                        file_dict[file_id] = [file_info]
-                    # Track updated cache entries
-                    cache_updates.append(file_path)
-                    
-                    # Write cache to file if batch size is reached
-                    if len(cache_updates) >= batch_size:
-                        write_cache_to_file(cache, cache_file)
-                        cache_updates.clear()
-                    
-        # Final write for any remaining updates
-        if cache_updates:
-            write_cache_to_file(cache, cache_file)
-
-        # Filter out file_ids with only one element
-        file_dict = {file_id: file_info_list for file_id, file_info_list in file_dict.items() if len(file_info_list) > 1}
+    if hash_workers is None:
+        hash_workers = os.cpu_count()
+    if cache_file is None:
+        # 缓存文件名包含哈希算法名，切换算法时自动放弃旧缓存
+        cache_file = f'hash_cache_{HASH_ALGO_NAME}.sqlite'
+    # 关键字集合只编译一次，热循环里按单遍扫描匹配
+    exclude_matcher = build_keyword_matcher(exclude_keywords)
+
+    cache = open_hash_cache(cache_file)
+    file_dict = {}
+    cache_updates = []
+    # batch_size 只是初始批量，之后按提交耗时自适应调整
+    batch_limit = batch_size
+
+    # 第一遍：仅按文件大小分组，大小唯一的文件不可能是重复文件
+    directories = list(set(directories))
+    # 不同目录（尤其是不同挂载点）是独立的 I/O 域，可以并行遍历
+    if len(directories) > 1:
+        with ThreadPoolExecutor(max_workers=len(directories)) as executor:
+            partial_dicts = list(executor.map(
+                lambda d: _collect_sizes(d, exclude_matcher, min_size), directories))
+    else:
+        partial_dicts = [_collect_sizes(directories[0], exclude_matcher, min_size)]
+    size_dict = {}
+    for partial in partial_dicts:
+        for size, metas in partial.items():
+            if size in size_dict:
+                size_dict[size].extend(metas)
+            else:
+                size_dict[size] = metas
+
+    # 第二遍：大小相同的文件先按首尾指纹分组，只对指纹也相同的做全量哈希。
+    # 硬链接共享同一份存储，既不算重复也无需重复哈希，按 (dev, ino) 只保留一个
+    size_candidates = []
+    seen_inodes = set()
+    for size, metas in size_dict.items():
+        unique_metas = []
+        for meta in metas:
+            st = meta[1]
+            inode_key = (st.st_dev, st.st_ino)
+            if inode_key in seen_inodes:
+                logger.debug("Skipping hardlink: %s", meta[0])
+                continue
+            seen_inodes.add(inode_key)
+            unique_metas.append(meta)
+        if len(unique_metas) < 2:
+            continue
+        for meta in unique_metas:
+            size_candidates.append((size, meta))
+
+    # 哈希在 OpenSSL/blake3 内部释放 GIL，线程池可以让读盘和哈希并行；
+    # 机械盘上寻道为主时可用 --hash-workers 调低并发
+    with ThreadPoolExecutor(max_workers=hash_workers) as executor:
+        fingerprints = executor.map(
+            lambda c: get_quick_fingerprint(c[1][0], cache, c[1][1]), size_candidates)
+        fingerprint_dict = {}
+        for candidate, fingerprint in zip(size_candidates, fingerprints):
+            if fingerprint is None:
+                continue
+            if fingerprint in fingerprint_dict:
+                fingerprint_dict[fingerprint].append(candidate)
+            else:
+                fingerprint_dict[fingerprint] = [candidate]
+
+        candidates = []
+        for group in fingerprint_dict.values():
+            if len(group) >= 2:
+                candidates.extend(group)
+
+        # 冷缓存时磁盘是瓶颈：哈希第 N 个文件时预告第 N+k 个，
+        # 内核的预读和当前文件的哈希计算重叠进行
+        for candidate in candidates[:_PREFETCH_LOOKAHEAD]:
+            _advise_willneed(candidate[1][0])
+
+        def _hash_candidate(index):
+            ahead = index + _PREFETCH_LOOKAHEAD
+            if ahead < len(candidates):
+                _advise_willneed(candidates[ahead][1][0])
+            size, (file_path, st, file_type) = candidates[index]
+            return get_file_id(file_path, cache, st)
+
+        file_ids = executor.map(_hash_candidate, range(len(candidates)))
+        # 计时窗口从这里开始，避免把前面遍历和指纹阶段算进单文件耗时
+        batch_started = time.monotonic()
+        for (size, (file_path, st, file_type)), file_id in zip(candidates, file_ids):
+            if not file_id:
+                logger.error("Error generating file ID for %s", file_path)
+                continue
+            file_info = FileInfo(
+                path=file_path,
+                size=size,  # File size in bytes
+                type=file_type,
+                modified_time=st.st_mtime
+            )
+            logger.debug("Process File ID: %s, File Info: %s", file_id, file_info)
+
+            if file_id in file_dict:
+                file_dict[file_id].append(file_info)
+            else:
+                file_dict[file_id] = [file_info]
+            # Track updated cache entries
+            cache_updates.append(file_path)
+
+            # Commit cache updates if batch size is reached
+            if len(cache_updates) >= batch_limit:
+                elapsed = time.monotonic() - batch_started
+                per_file = elapsed / len(cache_updates)
+                flush_started = time.monotonic()
+                cache.commit()
+                flush_cost = time.monotonic() - flush_started
+                # 自适应批量：让提交开销相对单文件处理时间保持在 ~10% 以内
+                if per_file > 0:
+                    batch_limit = min(100000, max(10, int(10 * flush_cost / per_file)))
+                cache_updates.clear()
+                batch_started = time.monotonic()
+
+    # Final commit for any remaining updates
+    cache.commit()
+    cache.close()
+
+    # Filter out file_ids with only one element
+    file_dict = {file_id: file_info_list for file_id, file_info_list in file_dict.items() if len(file_info_list) > 1}
 
     return file_dict
 
+# 重复组数达到该规模时，优先级计算才值得分发到进程池
+_PARALLEL_GROUP_THRESHOLD = 10000
+
+
+def _assign_group_priorities(files, retained_paths, priority_order):
+    """为单个重复组排序并设置优先级，返回处理后的组。"""
+    priority_counter = 1  # Start from 1 for non-retained files
+    # 每个文件只计算一次排序键，避免排序比较时反复重建元组和扫描路径
+    sep = os.sep
+    if priority_order == ['path']:
+        # 只按路径深度排序时键就是一个整数，不必构造元组
+        files.sort(key=lambda file_info: -file_info.path.count(sep))
+    else:
+        decorated = [
+            (
+                tuple(
+                    file_info.modified_time if order == 'modified_time'  # 修改时间字段升序排列
+                    else (-getattr(file_info, order) if order != 'path'  # 其他数值字段降序排列
+                          else -file_info.path.count(sep))  # 路径字段按目录深度降序
+                    for order in priority_order
+                ),
+                file_info,
+            )
+            for file_info in files
+        ]
+        decorated.sort(key=operator.itemgetter(0))
+        files[:] = [file_info for _, file_info in decorated]
+    # Assign priorities to all files
+    for file_info in files:
+        # 命中 retain 关键字的路径已在父进程里用自动机单遍匹配好
+        if file_info.path in retained_paths:
+            file_info.priority = 0
+        else:
+            file_info.priority = priority_counter
+            priority_counter += 1
+    return files
+
 def assign_priorities(file_dict, retain_keywords, priority_order=None):
     """Assign priorities to files based on the given criteria."""
     if priority_order is None:
         # Default priority order
         priority_order = ['modified_time', 'path']
 
-    for file_id, files in file_dict.items():
-        # 检查同一 file_id 下的文件大小是否一致
-        file_sizes = {file['size'] for file in files}
-        if len(file_sizes) > 1:
-            # 如果文件大小不一致，将所有文件的优先级设置为 0
-            for file_info in files:
-                file_info['priority'] = 0
-            # 打印文件大小不一致的 file_id 及文件列表
-            logger.error("File ID with inconsistent sizes: %s", file_id)
+    # retain 关键字在这里统一匹配一遍（自动机单遍扫描），
+    # 子进程只需收到命中路径的集合，不用逐关键字扫描每条路径
+    retain_matcher = build_keyword_matcher(retain_keywords)
+    retained_paths = set()
+    if retain_matcher is not None:
+        for files in file_dict.values():
             for file_info in files:
-                logger.warning(f"  Path: {file_info['path']}, Size: {file_info['size']}")
-            continue
-
-        priority_counter = 1  # Start from 1 for non-retained files
-        files.sort(
-            key=lambda x: tuple(
-                x[order] if order == 'modified_time'  # 修改时间字段升序排列
-                else (-x[order] if order != 'path'  # 其他数值字段降序排列
-                      else -x[order].count(os.sep))  # 路径字段按目录深度降序
-                for order in priority_order
+                if retain_matcher(file_info.path):
+                    retained_paths.add(file_info.path)
+
+    # find_duplicates 先按大小分组再哈希，同一 file_id 下的文件大小必然一致，
+    # 这里不再做大小一致性检查；各组之间相互独立
+    if len(file_dict) >= _PARALLEL_GROUP_THRESHOLD:
+        # 纯 Python 的排序和字符串处理受 GIL 限制，组数大时用进程池并行
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+            results = executor.map(
+                _assign_group_priorities,
+                file_dict.values(),
+                itertools.repeat(retained_paths),
+                itertools.repeat(priority_order),
+                chunksize=256
             )
-        )
-        # Assign priorities to all files
-        for file_info in files:
-            # 检查文件路径是否包含 retain_keywords
-            if retain_keywords and any(keyword in file_info['path'] for keyword in retain_keywords):
-                file_info['priority'] = 0
-            else:
-                file_info['priority'] = priority_counter
-                priority_counter += 1
+            for file_id, files in zip(list(file_dict.keys()), results):
+                file_dict[file_id] = files
+    else:
+        for files in file_dict.values():
+            _assign_group_priorities(files, retained_paths, priority_order)
 
 
 def retain_files(file_dict, action, move_to_dir=None, try_run=False):
     """Retain files based on the priority and process the rest."""
     for file_id, files in file_dict.items():
-        # Sort files by priority (lowest priority number first)
-        files.sort(key=lambda x: x['priority'])
-        # Find the highest priority (lowest priority number)
-        highest_priority = files[0]['priority']
-        
+        # 一次 min 扫描找出最高优先级（数值最小），不必整组排序
+        highest_priority = min(files, key=operator.attrgetter('priority')).priority
+
         # Process files with priority higher than the highest retained priority
         for file in files:
-            if file['priority'] > highest_priority:
+            if file.priority > highest_priority:
                 process_file(file, action, move_to_dir, try_run, file_id)
 
 
@@ -199,84 +555,116 @@ def retain_files(file_dict, action, move_to_dir=None, try_run=False):
 #     return byte_length <= 255
 
 
+def _move_file(src, dst):
+    """移动文件；同文件系统时 os.rename 只改元数据，跨设备再回退到 shutil.move。"""
+    try:
+        os.rename(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.move(src, dst)
+
+
 def process_file(file, action, move_to_dir=None, try_run=False, file_id=None):
     # 操作类型校验
     if action not in ['delete', 'move']:
-        logger.warning(f"Unsupported action: {action}. Skipping file: {file['path']}")
+        logger.warning("Unsupported action: %s. Skipping file: %s", action, file.path)
         return
 
     if action == 'delete':
         if try_run:
-            logger.info(f"[TRY RUN] Would delete: {file['path']}")
+            logger.info("[TRY RUN] Would delete: %s", file.path)
         else:
             try:
-                os.remove(file['path'])
-                logger.info(f"Deleted: {file['path']}")
+                os.remove(file.path)
+                logger.info("Deleted: %s", file.path)
             except Exception as e:
-                logger.error(f"Error deleting {file['path']}: {e}")
+                logger.error("Error deleting %s: %s", file.path, e)
     elif action == 'move':
         if move_to_dir:
             # 创建file_id目录
             target_dir = os.path.join(move_to_dir, file_id)
             # 获取源文件的相对路径（基于系统根目录）
-            source_dir = os.path.dirname(file['path'])
+            source_dir = os.path.dirname(file.path)
             relative_dir = os.path.relpath(source_dir, start='/')  # 转换为相对路径以避免绝对路径问题
             # 构建目标子目录
             target_subdir = os.path.join(target_dir, relative_dir)
             
-            if not os.path.exists(target_subdir):
-                os.makedirs(target_subdir)
+            os.makedirs(target_subdir, exist_ok=True)
             
             # 保持原始文件名
-            file_name = os.path.basename(file['path'])
+            file_name = os.path.basename(file.path)
             new_path = os.path.join(target_subdir, file_name)
             
             if try_run:
-                logger.info(f"[TRY RUN] Would move: {file['path']} to {new_path}")
+                logger.info("[TRY RUN] Would move: %s to %s", file.path, new_path)
             else:
                 # 新增空间检查逻辑（开始）
                 total, used, free = shutil.disk_usage(move_to_dir)
-                file_size = os.path.getsize(file['path'])
+                file_size = file.size
                 free_percent = (free / total * 100) if total > 0 else 0
-                logger.debug(f"移动文件需要空间：{file_size} 字节，剩余空间: {free} 字节 ({free_percent:.1f}%)")
+                logger.debug("移动文件需要空间：%s 字节，剩余空间: %s 字节 (%.1f%%)", file_size, free, free_percent)
 
                 # 空间不足判断
                 if free < file_size or free_percent < 5:
-                    logger.error(f"空间不足阻止移动：{file['path']} -> {new_path}")
-                    logger.error(f"需要空间: {file_size} 字节 | 剩余空间: {free} 字节 ({free_percent:.1f}%)")
+                    logger.error("空间不足阻止移动：%s -> %s", file.path, new_path)
+                    logger.error("需要空间: %s 字节 | 剩余空间: %s 字节 (%.1f%%)", file_size, free, free_percent)
                     return None
                 # 新增空间检查逻辑（结束）
                 try:
-                    shutil.move(file['path'], new_path)
-                    logger.info(f"Moved: {file['path']} to {new_path}")
+                    _move_file(file.path, new_path)
+                    logger.info("Moved: %s to %s", file.path, new_path)
                 except Exception as e:
-                    logger.error(f"Error moving {file['path']} to {new_path}: {e}")
+                    logger.error("Error moving %s to %s: %s", file.path, new_path, e)
         else:
-            new_path = file['path'] + '.dup_finder'
+            new_path = file.path + '.dup_finder'
             if try_run:
-                logger.info(f"[TRY RUN] Would rename: {file['path']} to {new_path}")
+                logger.info("[TRY RUN] Would rename: %s to %s", file.path, new_path)
             else:
                 try:
-                    shutil.move(file['path'], new_path)
-                    logger.info(f"Renamed: {file['path']} to {new_path}")
+                    # 加后缀重命名必然在同一文件系统内，直接走 rename
+                    os.rename(file.path, new_path)
+                    logger.info("Renamed: %s to %s", file.path, new_path)
                 except Exception as e:
-                    logger.error(f"Error renaming {file['path']} to {new_path}: {e}")
-def main(directories, action, priority_order=None, move_to_dir=None, try_run=False, exclude_keywords=None, retain_keywords=None, file_dict_path=None):
+                    logger.error("Error renaming %s to %s: %s", file.path, new_path, e)
+def main(directories, action, priority_order=None, move_to_dir=None, try_run=False, exclude_keywords=None, retain_keywords=None, file_dict_path=None, hash_workers=None, min_size=1):
     if file_dict_path:
         # 从指定文件中加载 file_dict
-        with open(file_dict_path, 'r') as f:
-            file_dict = json.load(f)
-        logger.info(f"Loaded file_dict from {file_dict_path}")
+        if file_dict_path.endswith('.pkl.gz'):
+            # pickle 副本反序列化比解析 JSON 快一个数量级
+            with gzip.open(file_dict_path, 'rb') as f:
+                file_dict = pickle.load(f)
+        else:
+            with open(file_dict_path, 'r') as f:
+                raw_dict = json.load(f)
+            file_dict = {
+                file_id: [FileInfo(**file_info) for file_info in files]
+                for file_id, files in raw_dict.items()
+            }
+        logger.info("Loaded file_dict from %s", file_dict_path)
     else:
         # 找到重复文件
-        file_dict = find_duplicates(directories, exclude_keywords=exclude_keywords)
+        file_dict = find_duplicates(directories, exclude_keywords=exclude_keywords, hash_workers=hash_workers, min_size=min_size)
         assign_priorities(file_dict, retain_keywords, priority_order=priority_order)
         # 保存 file_dict 到文件
         current_time = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
         output_file = f"duplicates_{current_time}.json"
-        with open(output_file, 'w') as f:
-            json.dump(file_dict, f, indent=4)
-        logger.info(f"Saved file_dict to {output_file}")
+        output_dict = {
+            file_id: [asdict(file_info) for file_info in files]
+            for file_id, files in file_dict.items()
+        }
+        with open(output_file, 'wb') as f:
+            if orjson:
+                # orjson 的 C 编码器比标准库 json 快 3-10 倍，且省去中间字符串
+                f.write(orjson.dumps(output_dict, option=orjson.OPT_INDENT_2))
+            else:
+                f.write(json.dumps(output_dict, indent=4).encode('utf-8'))
+        logger.info("Saved file_dict to %s", output_file)
+        # 同时保存 pickle 副本，--duplicates-result-file 复用时省去 JSON 解析
+        pickle_file = f"duplicates_{current_time}.pkl.gz"
+        with gzip.open(pickle_file, 'wb') as f:
+            pickle.dump(file_dict, f, protocol=5)
+        logger.info("Saved file_dict to %s", pickle_file)
 
     retain_files(file_dict, action, move_to_dir, try_run)
 
@@ -295,6 +683,10 @@ if __name__ == "__main__":
     parser.add_argument("--retain-file", required=False, help="File containing retain keywords, one per line")
     # 添加 duplicates-result-file 参数
     parser.add_argument("--duplicates-result-file", required=False, help="File containing the duplicates result JSON data")
+    # 添加 hash-workers 参数
+    parser.add_argument("--hash-workers", type=int, required=False, help="Number of hashing threads (default: CPU count); lower it on spinning disks")
+
+    parser.add_argument("--min-size", type=int, default=1, required=False, help="Skip files smaller than this many bytes (default: 1, i.e. skip empty files)")
 
     args = parser.parse_args()
     # 使用 subprocess.list2cmdline 重建命令行字符串
@@ -310,7 +702,7 @@ if __name__ == "__main__":
     if args.retain_file:
         retain_keywords_from_file = parse_exclude_file(args.retain_file)  # 使用 parse_exclude_file 函数读取 retain-file
         retain_keywords.extend(retain_keywords_from_file)
-    main(args.directories, args.action, args.priority_order, args.move_to_dir, args.try_run, exclude_keywords=exclude_keywords, retain_keywords=retain_keywords, file_dict_path=args.duplicates_result_file)
+    main(args.directories, args.action, args.priority_order, args.move_to_dir, args.try_run, exclude_keywords=exclude_keywords, retain_keywords=retain_keywords, file_dict_path=args.duplicates_result_file, hash_workers=args.hash_workers, min_size=args.min_size)
 
 
 